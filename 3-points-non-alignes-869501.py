@@ -1,7 +1,11 @@
 
 # See https://www.ilemaths.net/sujet-3-points-non-alignes-869501.html
 
+import json
+import os
+from functools import cache
 from math import gcd
+from multiprocessing import Pool
 from time import perf_counter
 
 
@@ -31,6 +35,215 @@ def solve(n):
                     pawns[i] += 1
 
 
+def solve_bitmask(n, line_masks=None, prefix=(), excluded=0, conflicts=None, length=None,
+                  resume=None, checkpoint=None, checkpoint_interval=1 << 16):
+    """Same search as solve but with the forbidden cells kept as a bitmask (bit col*n + row)
+
+    The search can be restricted to the solutions starting with the pawns of prefix, avoiding the excluded cells and
+    without two pawns on cells in conflict (conflicts[cell] is the mask of the cells in conflict with cell).
+    If length is given, yield the valid placements of the first length pawns instead of the full solutions.
+    Every checkpoint_interval nodes, checkpoint is called with the stack of the pawns (the last one is the next row to
+    try). Giving this stack as resume restarts the search exactly where it was.
+    """
+
+    if line_masks is None:
+        line_masks = get_line_masks(n)
+    if conflicts is None:
+        conflicts = [0] * (n*n)
+    if length is None:
+        length = 2*n
+    column_mask = (1 << n) - 1
+
+    pawns = [0] * (2*n)  # Same layout as in solve
+    cells = [0] * (2*n)  # cells[i] is the bit index of pawn i
+    forbidden = [excluded] + [0] * (2*n-1)  # forbidden[i] is the mask of the forbidden cells before pawn i is placed.
+
+    depth = len(prefix)
+    placed = tuple(prefix) if resume is None else tuple(resume[:-1])
+    for i, row in enumerate(placed):
+        pawns[i] = row
+        cells[i] = cell = (i >> 1) * n + row
+        if forbidden[i] >> cell & 1 or (i & 1 and row <= pawns[i-1]):
+            return
+        if i+1 < 2*n:
+            masks = line_masks[cell]
+            mask = forbidden[i] | conflicts[cell]
+            for j in range(i):
+                mask |= masks[cells[j]]
+            forbidden[i+1] = mask
+    i = len(placed)
+    if resume is not None:
+        pawns[i] = resume[-1]
+    elif i >= length:
+        yield tuple(pawns[:i])
+        return
+    else:
+        pawns[i] = 0 if not i & 1 else pawns[i-1] + 1
+
+    nodes = 0
+    while i >= depth:
+        if checkpoint is not None:
+            nodes += 1
+            if nodes % checkpoint_interval == 0:
+                checkpoint(tuple(pawns[:i+1]))
+
+        column = i >> 1
+        available = (~forbidden[i] >> (column * n)) & column_mask & -(1 << pawns[i])
+        if not available:
+            i -= 1
+            pawns[i] += 1
+            continue
+
+        pawns[i] = (available & -available).bit_length() - 1
+        cells[i] = cell = column * n + pawns[i]
+        i += 1
+        if i < length:
+            pawns[i] = 0 if not i & 1 else pawns[i-1] + 1
+            masks = line_masks[cell]
+            mask = forbidden[i-1] | conflicts[cell]
+            for j in range(i-1):
+                mask |= masks[cells[j]]
+            forbidden[i] = mask
+        else:
+            yield tuple(pawns[:length])
+            i -= 1
+            pawns[i] += 1
+
+
+def solve_symmetric(n):
+    """Yield the canonical solutions (smallest of their D4 orbit) with the size of their orbit"""
+
+    line_masks = get_line_masks(n)
+    # The 8 ways to read the two pawns of a border starting from one of its corners.
+    readings = [[col*n + row for row in range(n)] for col in (0, n-1)]
+    readings += [[col*n + row for col in range(n)] for row in (0, n-1)]
+    readings += [reading[::-1] for reading in readings]
+
+    # The first column (a, b) of a canonical solution is the smallest of its border readings. So no border has a pawn
+    # closer than a to a corner, and if it has one at a, its next pawn is not closer than b.
+    for a in range(n):
+        excluded = 0
+        for reading in readings:
+            for cell in reading[:a]:
+                excluded |= 1 << cell
+        for b in range(a+1, n-a):
+            conflicts = [0] * (n*n)
+            for reading in readings:
+                for cell in reading[a+1:b]:
+                    conflicts[reading[a]] |= 1 << cell
+                    conflicts[cell] |= 1 << reading[a]
+
+            for solution in solve_bitmask(n, line_masks, (a, b), excluded, conflicts):
+                images = set(gen_images(solution))
+                if solution == min(images):
+                    yield solution, len(images)
+
+
+def gen_images(pawns):
+    """Generate the 8 images of a solution under the D4 symmetry group"""
+    n = len(pawns) // 2
+    points = [(i >> 1, row) for i, row in enumerate(pawns)]
+    for transpose in (False, True):
+        for flip_col in (False, True):
+            for flip_row in (False, True):
+                columns = [[] for _ in range(n)]
+                for col, row in points:
+                    if transpose:
+                        col, row = row, col
+                    if flip_col:
+                        col = n-1 - col
+                    if flip_row:
+                        row = n-1 - row
+                    columns[col].append(row)
+                yield tuple(row for column in columns for row in sorted(column))
+
+
+def solve_parallel(n, columns=2, processes=None):
+    """Same solutions as solve_bitmask, searched in parallel from every valid placement of the first columns
+
+    The solutions are yielded by subtree, in the order the subtrees complete.
+    """
+    prefixes = tuple(solve_bitmask(n, length=2*columns))
+    with Pool(processes) as pool:
+        subtrees = pool.imap_unordered(solve_subtree, ((n, prefix) for prefix in prefixes))
+        for done, (prefix, solutions, duration) in enumerate(subtrees, 1):
+            print(f"[{done}/{len(prefixes)}] {prefix}: {len(solutions)} solutions in {duration:.3f}s")
+            yield from solutions
+
+
+def solve_to_file(n, path, interval=60.0):
+    """Append the solutions to the file path, one per line, and return their number
+
+    The search is checkpointed every interval seconds in path.checkpoint and resumed from there if it exists.
+    """
+    checkpoint_path = f'{path}.checkpoint'
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+    except FileNotFoundError:
+        state = {'n': n, 'offset': 0, 'count': 0, 'stack': []}
+    if state['n'] != n:
+        raise ValueError(f"{checkpoint_path} is a checkpoint for n={state['n']}, not n={n}")
+    if state['stack'] is None:  # Search already finished
+        return state['count']
+
+    with open(path, 'ab') as solutions_file:
+        # Drop the solutions found after the checkpoint, they will be found again.
+        solutions_file.truncate(state['offset'])
+        last_save = perf_counter()
+
+        def save(stack):
+            nonlocal last_save
+            if stack is not None and perf_counter() - last_save < interval:
+                return
+            solutions_file.flush()
+            os.fsync(solutions_file.fileno())
+            state['offset'], state['stack'] = solutions_file.tell(), stack
+            with open(f'{checkpoint_path}.tmp', 'w') as checkpoint_file:
+                json.dump(state, checkpoint_file)
+            os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+            last_save = perf_counter()
+
+        for solution in solve_bitmask(n, resume=state['stack'] or None, checkpoint=save):
+            solutions_file.write(f"{' '.join(map(str, solution))}\n".encode())
+            state['count'] += 1
+        save(None)
+
+    return state['count']
+
+
+def solve_subtree(task):
+    n, prefix = task
+    start = perf_counter()
+    solutions = tuple(solve_bitmask(n, get_line_masks(n), prefix))
+    return prefix, solutions, perf_counter() - start
+
+
+@cache
+def get_line_masks(n):
+    """line_masks[p][q] is the bitmask of the cells aligned with the cells p and q (excluding them)"""
+    line_masks = [[0] * (n*n) for _ in range(n*n)]
+    for p in range(n*n):
+        px, py = divmod(p, n)
+        for q in range(p+1, n*n):
+            qx, qy = divmod(q, n)
+            g = gcd(qx-px, qy-py)
+            dx, dy = (qx-px)//g, (qy-py)//g
+
+            # Walk back to the border then along the whole line
+            x, y = px, py
+            while 0 <= x-dx < n and 0 <= y-dy < n:
+                x, y = x-dx, y-dy
+            mask = 0
+            while 0 <= x < n and 0 <= y < n:
+                mask |= 1 << (x*n + y)
+                x, y = x+dx, y+dy
+            mask &= ~(1 << p | 1 << q)
+
+            line_masks[p][q] = line_masks[q][p] = mask
+    return line_masks
+
+
 def get_line(a, b, c, d):
     """Get the canonical form my - nx = k of the line going through (a,b) and (c,d)"""
     dx, dy = c-a, d-b
@@ -51,13 +264,42 @@ def show_grid(pawns):
     print()
 
 
-def main():
-    for n in range(2, 21):
+def benchmark(max_n=16):
+    print(f"{'n':>2} {'solutions':>9} {'solve':>10} {'bitmask':>10}")
+    for n in range(2, max_n+1):
         start = perf_counter()
         solutions = tuple(solve(n))
-        print(f"Found {len(solutions)} solutions for n={n} in {perf_counter()-start:.3f}s")
-        for solution in solutions:
-            show_grid(solution)
+        time_solve = perf_counter() - start
+
+        start = perf_counter()
+        solutions_bitmask = tuple(solve_bitmask(n))
+        time_bitmask = perf_counter() - start
+
+        assert solutions == solutions_bitmask
+        print(f"{n:2} {len(solutions):9} {time_solve:9.3f}s {time_bitmask:9.3f}s")
+
+
+def main(symmetric=False, processes=None, directory=None):
+    for n in range(2, 21):
+        start = perf_counter()
+        if directory is not None:
+            count = solve_to_file(n, os.path.join(directory, f'solutions_{n}.txt'))
+            print(f"Found {count} solutions for n={n} in {perf_counter()-start:.3f}s")
+        elif symmetric:
+            solutions = tuple(solve_symmetric(n))
+            print(f"Found {len(solutions)} canonical solutions ({sum(orbit for _, orbit in solutions)} solutions) "
+                  f"for n={n} in {perf_counter()-start:.3f}s")
+            for solution, orbit in solutions:
+                print(f"Orbit size: {orbit}")
+                show_grid(solution)
+        else:
+            if processes is None:
+                solutions = tuple(solve_bitmask(n))
+            else:
+                solutions = tuple(sorted(solve_parallel(n, processes=processes)))
+            print(f"Found {len(solutions)} solutions for n={n} in {perf_counter()-start:.3f}s")
+            for solution in solutions:
+                show_grid(solution)
 
 
 if __name__ == "__main__":
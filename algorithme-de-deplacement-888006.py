@@ -1,8 +1,19 @@
 # See https://www.ilemaths.net/sujet-algorithme-de-deplacement-888006.html
+from functools import partial
 from itertools import islice
+from multiprocessing import Pool
+from time import perf_counter
 
 import numpy
 from matplotlib import pyplot, animation, colors
+from scipy import sparse
+from scipy.sparse import _sparsetools
+from scipy.sparse import linalg as sparse_linalg
+
+try:
+    import pyamg
+except ImportError:
+    pyamg = None
 
 
 def get_move_probability(size, obstacles):
@@ -53,6 +64,67 @@ def gen_states(size, obstacles, start, end):
         state = state_
 
 
+def gen_states_inplace(size, obstacles, start, end):
+    """Same states as gen_states, computed by sparse matrix-vector products into two preallocated buffers: a yielded
+    state is overwritten 2 moves later"""
+    transition = get_transition_matrix(size, obstacles, end)
+    n = transition.shape[0]
+    state, state_ = numpy.zeros(n), numpy.zeros(n)
+    state[numpy.ravel_multi_index(start, size)] = 1
+
+    while True:
+        yield state.reshape(size)
+        # csr_matvec adds transition @ state to state_ in one call, without the output allocation of the @ operator
+        state_.fill(0)
+        _sparsetools.csr_matvec(n, n, transition.indptr, transition.indices, transition.data, state, state_)
+        state, state_ = state_, state
+
+
+def get_transition_matrix(size, obstacles, end):
+    """Sparse matrix of one move of gen_states on the flattened grid (the walk stops at end)"""
+    up, down, left, right = map(numpy.nan_to_num, get_move_probability(size, obstacles))
+    cells = numpy.arange(size[0] * size[1]).reshape(size)
+    sources = numpy.concatenate((cells[1:, :].ravel(), cells[:-1, :].ravel(), cells[:, 1:].ravel(), cells[:, :-1].ravel()))
+    targets = numpy.concatenate((cells[:-1, :].ravel(), cells[1:, :].ravel(), cells[:, :-1].ravel(), cells[:, 1:].ravel()))
+    probabilities = numpy.concatenate((up[1:, :].ravel(), down[:-1, :].ravel(), left[:, 1:].ravel(), right[:, :-1].ravel()))
+    probabilities[sources == cells[end]] = 0
+
+    return sparse.csr_matrix((probabilities, (targets, sources)), shape=(cells.size, cells.size))
+
+
+def get_move_density(size, obstacles, start, end, max_move=4000, block=1024, max_blocked_cells=1024):
+    """Return state[end] for the first max_move states of gen_states.
+
+    Grids of at most max_blocked_cells cells advance block moves per iteration: with rows[k] = e_end M^k, the densities
+    of the moves t..t+block-1 are rows @ state_t and state_t+block is M^block state_t. M^block is dense, so larger grids
+    step one move at a time with gen_states_inplace, in constant memory.
+    """
+    cells = size[0] * size[1]
+    if cells > max_blocked_cells:
+        states = islice(gen_states_inplace(size, obstacles, start, end), max_move)
+        return numpy.fromiter((state[end] for state in states), float, count=max_move)
+
+    transition = get_transition_matrix(size, obstacles, end)
+    block = min(block, max_move)
+    rows = numpy.zeros((block, cells))
+    row = numpy.zeros(cells)
+    row[numpy.ravel_multi_index(end, size)] = 1
+    transition_t = transition.T.tocsr()
+    for k in range(block):
+        rows[k] = row
+        row = transition_t @ row
+    jump = numpy.linalg.matrix_power(transition.toarray(), block)
+
+    state = numpy.zeros(cells)
+    state[numpy.ravel_multi_index(start, size)] = 1
+    density = numpy.empty(max_move)
+    for t in range(0, max_move, block):
+        numpy.matmul(rows[:max_move - t], state, out=density[t:t + block])
+        state = jump @ state
+
+    return density
+
+
 def animate_states(size, state_generator):
     figure, axes = pyplot.subplots()
     image = axes.imshow(numpy.zeros(size), norm=colors.LogNorm(vmin=0.001, vmax=1))
@@ -67,8 +139,10 @@ def animate_states(size, state_generator):
 
 
 def draw_move_density(end, state_generator, max_move=4000):
-    density = list(islice((state[end] for state in state_generator), max_move))
+    draw_density(numpy.fromiter((state[end] for state in state_generator), float, count=max_move))
+
 
+def draw_density(density):
     figure, axes = pyplot.subplots()
     axes.plot(density, '.')
     # axes.set_yscale('log')
@@ -82,7 +156,7 @@ def compute_expected_moves(end, state_generator, max_moves=10000):
     return expected_moves
 
 
-def solve_system(size, obstacles, start, end):
+def get_expected_moves_dense(size, obstacles, end):
     index = [(row, col) for row in range(size[0]) for col in range(size[1]) if (row, col) not in obstacles]
     index_map = {cell: i for i, cell in enumerate(index)}
 
@@ -104,14 +178,107 @@ def solve_system(size, obstacles, start, end):
 
     x = numpy.linalg.solve(a, b)
 
-    print(x[index_map[start]])
-
     expected_moves = numpy.zeros(size)
     for cell in obstacles:
         expected_moves[cell] = float('nan')
     for i, cell in enumerate(index):
         expected_moves[cell] = x[i]
 
+    return expected_moves
+
+
+def get_walk_operator(size, obstacles):
+    """Return the free cells and the sparse system of the walk over them, ignoring the end cell.
+
+    The matrix has the number of free neighbours on the diagonal and -1 between adjacent free cells. The end cell is
+    dropped later from the unknowns (its expected moves are 0), which leaves a symmetric positive definite system.
+    """
+    free = numpy.ones(size, dtype=bool)
+    if obstacles:
+        free[tuple(numpy.array(obstacles).T)] = False
+    index = numpy.full(size, -1)
+    index[free] = numpy.arange(numpy.count_nonzero(free))
+
+    # Pairs of adjacent free cells, vertically and horizontally
+    vertical, horizontal = free[:-1, :] & free[1:, :], free[:, :-1] & free[:, 1:]
+    i = numpy.concatenate((index[:-1, :][vertical], index[:, :-1][horizontal]))
+    j = numpy.concatenate((index[1:, :][vertical], index[:, 1:][horizontal]))
+    i, j = numpy.concatenate((i, j)), numpy.concatenate((j, i))
+
+    degree = numpy.bincount(i, minlength=numpy.count_nonzero(free))
+    diagonal = numpy.arange(len(degree))
+    a = sparse.csr_matrix((numpy.concatenate((-numpy.ones(len(i)), degree)),
+                           (numpy.concatenate((i, diagonal)), numpy.concatenate((j, diagonal)))),
+                          shape=(len(degree), len(degree)))
+
+    return free, a, degree.astype(float)
+
+
+def get_preconditioner(a):
+    """Algebraic multigrid V-cycle when pyamg is available, incomplete LU otherwise (much slower on large grids)"""
+    if pyamg is not None:
+        return pyamg.smoothed_aggregation_solver(a.tocsr(), symmetry='symmetric').aspreconditioner(cycle='V')
+    # No pivoting and a symmetric ordering keep the factorisation close to symmetric, as the conjugate gradient needs
+    ilu = sparse_linalg.spilu(a.tocsc(), drop_tol=1e-4, fill_factor=10, permc_spec='MMD_AT_PLUS_A',
+                              diag_pivot_thresh=0, options={'SymmetricMode': True})
+    return sparse_linalg.LinearOperator(a.shape, ilu.solve)
+
+
+def get_expected_moves_sparse(size, obstacles, end, method='direct', operator=None):
+    """Same system as get_expected_moves_dense, assembled as a sparse matrix and solved with spsolve, cg or pcg.
+
+    The system is symmetric positive definite, pcg is the conjugate gradient preconditioned by get_preconditioner.
+    """
+    free, a, b = get_walk_operator(size, obstacles) if operator is None else operator
+
+    unknowns = free.copy()
+    unknowns[end] = False
+    keep = unknowns[free]
+    a, b = a[keep][:, keep], b[keep]
+
+    if method == 'direct':
+        x = sparse_linalg.spsolve(a.tocsc(), b, permc_spec='MMD_AT_PLUS_A')  # Symmetric ordering
+    elif method == 'cg':
+        x, info = sparse_linalg.cg(a, b, rtol=1e-12, maxiter=100 * max(size))
+        if info:
+            raise RuntimeError(f"Conjugate gradient did not converge ({info})")
+    elif method == 'pcg':
+        x, info = sparse_linalg.cg(a, b, rtol=1e-12, maxiter=10 * max(size), M=get_preconditioner(a))
+        if info:
+            raise RuntimeError(f"Preconditioned conjugate gradient did not converge ({info})")
+    else:
+        raise ValueError(f"Unknown method {method!r}")
+
+    expected_moves = numpy.full(size, float('nan'))
+    expected_moves[unknowns] = x
+    expected_moves[end] = 0
+    return expected_moves
+
+
+def get_expected_moves_batch(size, obstacles, ends, method='direct', processes=None):
+    """Return the expected moves grid for each end, assembling the walk operator once and solving the ends in a pool"""
+    operator = get_walk_operator(size, obstacles)
+    with Pool(processes) as pool:
+        return pool.map(partial(get_expected_moves_sparse, size, obstacles, method=method, operator=operator), ends)
+
+
+def get_border_cells(size, obstacles):
+    """Return the free cells on the border of the grid, starting with the corners"""
+    corners = [(0, 0), (0, size[1] - 1), (size[0] - 1, 0), (size[0] - 1, size[1] - 1)]
+    edges = [(row, col) for row in (0, size[0] - 1) for col in range(1, size[1] - 1)]
+    edges += [(row, col) for col in (0, size[1] - 1) for row in range(1, size[0] - 1)]
+    obstacles = set(obstacles)
+    return [cell for cell in dict.fromkeys(corners + edges) if cell not in obstacles]
+
+
+def solve_system(size, obstacles, start, end, sparse_method=None):
+    if sparse_method is None:
+        expected_moves = get_expected_moves_dense(size, obstacles, end)
+    else:
+        expected_moves = get_expected_moves_sparse(size, obstacles, end, sparse_method)
+
+    print(expected_moves[start])
+
     figure, axes = pyplot.subplots()
     colors = axes.imshow(expected_moves)
     figure.colorbar(colors, ax=axes)
@@ -120,6 +287,65 @@ def solve_system(size, obstacles, start, end):
     return expected_moves[start]
 
 
+def benchmark(sizes=(10, 50, 100, 150, 300, 500, 1000, 2000), max_sizes=None):
+    """Time the dense and sparse solvers on square grids with an obstacle every 4 cells
+
+    max_sizes gives the largest grid side per method: the dense matrix, the fill-in of the sparse LU and the iterations
+    of the plain conjugate gradient grow too fast beyond. Only the multigrid preconditioner goes to 2000x2000, the
+    incomplete LU one (without pyamg) is about as slow as the plain conjugate gradient at 1000x1000.
+    """
+    max_sizes = {'dense': 100, 'direct': 500, 'cg': 500, 'pcg': 500 if pyamg is None else 2000} | (max_sizes or {})
+    print(f"{'size':>5}", *(f"{method:>9}" for method in max_sizes), f"{'end to start':>14}")
+    for n in sizes:
+        size = (n, n)
+        obstacles = [(row, col) for row in range(2, n, 4) for col in range(2, n, 4)]
+        start, end = (n - 1, 0), (0, n - 1)
+
+        times, results = [], []
+        for method, max_size in max_sizes.items():
+            if n > max_size:
+                times.append(float('nan'))
+                continue
+            t = perf_counter()
+            if method == 'dense':
+                expected_moves = get_expected_moves_dense(size, obstacles, end)
+            else:
+                expected_moves = get_expected_moves_sparse(size, obstacles, end, method)
+            times.append(perf_counter() - t)
+            results.append(expected_moves)
+
+        for expected_moves in results[1:]:
+            assert numpy.allclose(expected_moves, results[0], rtol=1e-6, equal_nan=True)
+        print(f"{n:5}", *(f"{t:8.3f}s" if t == t else f"{'-':>9}" for t in times), f"{results[0][start]:14.1f}")
+
+
+def benchmark_density(sizes=(10, 30, 50, 200), max_move=20000):
+    """Time max_move moves of gen_states, gen_states_inplace and get_move_density on square grids with an obstacle every
+    4 cells (get_move_density is blocked up to 32x32 and steps gen_states_inplace beyond)"""
+    methods = {
+        'gen_states': lambda *args: numpy.fromiter((state[args[3]] for state in islice(gen_states(*args), max_move)),
+                                                   float, count=max_move),
+        'inplace': lambda *args: numpy.fromiter((state[args[3]] for state in islice(gen_states_inplace(*args), max_move)),
+                                                float, count=max_move),
+        'density': lambda *args: get_move_density(*args, max_move=max_move),
+    }
+    print(f"{'size':>5}", *(f"{method:>11}" for method in methods))
+    for n in sizes:
+        size = (n, n)
+        obstacles = [(row, col) for row in range(2, n, 4) for col in range(2, n, 4)]
+        start, end = (n - 1, 0), (0, n - 1)
+
+        times, results = [], []
+        for function in methods.values():
+            t = perf_counter()
+            results.append(function(size, obstacles, start, end))
+            times.append(perf_counter() - t)
+
+        for density in results[1:]:
+            assert numpy.allclose(density, results[0], rtol=1e-9, atol=1e-15)
+        print(f"{n:5}", *(f"{t:10.3f}s" for t in times))
+
+
 def main():
     size = (10, 10)
     obstacles = [(8, 2), (2, 3), (5, 3), (10, 4), (3, 6), (7, 6), (10, 6), (2, 9), (4, 10),
@@ -135,8 +361,8 @@ def main():
     state_generator = gen_states(size, obstacles, start, end)
 
     animate_states(size, gen_states(size, obstacles, start, end))
-    draw_move_density(end, gen_states(size, obstacles, start, end))
-    compute_expected_moves(end, gen_states(size, obstacles, start, end))
+    draw_density(get_move_density(size, obstacles, start, end))
+    compute_expected_moves(end, gen_states_inplace(size, obstacles, start, end))
     solve_system(size, obstacles, start, end)
 
 
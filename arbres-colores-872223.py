@@ -1,6 +1,12 @@
 
 # https://www.ilemaths.net/sujet-arbres-colores-872223.html
 
+import sys
+from itertools import islice
+from math import isqrt
+
+import numpy
+
 
 def solve(n):
     """Find the color, the group and the position of the nth tree."""
@@ -9,12 +15,10 @@ def solve(n):
     if n < 3:
         return 'R', 1, n
 
-    step = 3
+    # The trees 3 to n-1 contain the whole blocks of 2*3 + 2*4 + ... + 2*(step-1) = step*(step-1) - 6 trees.
     n -= 3
-
-    while 2 * step <= n:
-        n -= 2 * step
-        step += 1
+    step = (1 + isqrt(4 * (n + 6) + 1)) // 2
+    n -= step * (step - 1) - 6
 
     color = 'V' if n < step else 'R'
     group = (step-3)*2 + (2 if n < step else 3)
@@ -23,11 +27,51 @@ def solve(n):
     return color, group, position
 
 
-def main():
-    index = int(input())
-    color, group, position = solve(index)
-    print(f'{index}th tree is {color} and is the {position}th tree of the {group}th group of trees.')
+def solve_batch(indices):
+    """Same as solve for an array of indices (up to 10**18), returns arrays of colors, groups and positions."""
+    n = numpy.asarray(indices, dtype=numpy.int64) - 3
+
+    # Float square root then exact integer correction
+    limit = n + 6
+    step = ((1 + numpy.sqrt(4 * limit.astype(numpy.float64) + 1)) // 2).astype(numpy.int64)
+    step -= step * (step - 1) > limit
+    step += (step + 1) * step <= limit
+    n -= step * (step - 1) - 6
+
+    green = n < step
+    colors = numpy.where(green, 'V', 'R')
+    groups = (step-3)*2 + numpy.where(green, 2, 3)
+    positions = 1 + numpy.where(green, n, n-step)
+
+    first = numpy.asarray(indices) < 3
+    colors[first], groups[first], positions[first] = 'R', 1, numpy.asarray(indices)[first]
+
+    return colors, groups, positions
+
+
+def solve_stream(lines, chunk_size=1 << 20):
+    """Yield the output lines for a stream of lines containing one index each, solving them by chunks.
+
+    Blank lines (like a trailing empty line) are skipped.
+    """
+    lines = (line for line in lines if line.strip())
+    while chunk := list(islice(lines, chunk_size)):
+        indices = numpy.array([int(line) for line in chunk], dtype=numpy.int64)
+        colors, groups, positions = solve_batch(indices)
+        yield from map('{} {} {} {}'.format, indices, colors, groups, positions)
+
+
+def main(path=None):
+    if path is None:
+        index = int(input())
+        color, group, position = solve(index)
+        print(f'{index}th tree is {color} and is the {position}th tree of the {group}th group of trees.')
+    elif path == '-':
+        sys.stdout.writelines(f'{line}\n' for line in solve_stream(sys.stdin))
+    else:
+        with open(path) as file:
+            sys.stdout.writelines(f'{line}\n' for line in solve_stream(file))
 
 
 if __name__ == "__main__":
-    main()
+    main(*sys.argv[1:2])
@@ -2,10 +2,12 @@
 # https://www.ilemaths.net/sujet-atteindre-12-variante-873815.html
 
 # Ces import manquaient
+from multiprocessing import Pool
 from random import randint
 from timeit import timeit
 
 import matplotlib.pyplot as plt
+import numpy
 
 
 def verif(l, nb):
@@ -42,14 +44,69 @@ def suite_2(nb):
     return l
 
 
-def test(compt, nb):
-    n = []
-    d = []
-    for i in range(compt):
-        # l = suite(nb)
-        l = suite_2(nb)
-        n.append(len(l))
-        d.append(l[-1])     # l[-1] est le dernier élément de l
+def suite_batch(compt, nb, rng):
+    # Version vectorisée de 'suite_2(nb)' qui fait avancer compt essais en même temps
+    # Les nombres atteignables de chaque essai sont les bits d'une ligne de mots de 64 bits
+    # Après k lancers les nombres sont au plus 6k, on ajoute donc des mots au fur et à mesure (aucune troncature)
+    # Les essais terminés sont retirés du tableau
+    # Retourne pour chaque essai le nombre de lancers et le dernier dé (n et d de test)
+    nb = abs(nb)
+    reflections = numpy.array([low for dice in range(1, 7) for low in REFLECTIONS[dice]], dtype=numpy.uint64)
+    offsets = numpy.cumsum([0] + [1 << dice for dice in range(1, 6)])
+
+    n = numpy.zeros(compt, dtype=numpy.int64)
+    d = numpy.zeros(compt, dtype=numpy.int64)
+    active = numpy.arange(compt) if nb else numpy.arange(0)
+    numbers = numpy.zeros((len(active), (nb >> 6) + 1), dtype=numpy.uint64)
+    numbers[:, 0] = 1
+    throws = 0
+    while len(active):
+        throws += 1
+        if 6 * throws >= 64 * numbers.shape[1]:
+            numbers = numpy.hstack((numbers, numpy.zeros((len(active), 1), dtype=numpy.uint64)))
+
+        dices = rng.integers(1, 7, size=len(active))
+        shift = dices.astype(numpy.uint64)[:, None]
+        carry = numpy.uint64(64) - shift
+        numbers_ = numbers << shift  # n + dice
+        numbers_[:, 1:] |= numbers[:, :-1] >> carry
+        numbers_ |= numbers >> shift  # abs(n - dice) pour n >= dice
+        numbers_[:, :-1] |= numbers[:, 1:] << carry
+        low = numbers[:, 0] & ((numpy.uint64(1) << shift[:, 0]) - numpy.uint64(1))
+        numbers_[:, 0] |= reflections[offsets[dices - 1] + low.astype(numpy.int64)]  # abs(n - dice) pour n < dice
+        numbers = numbers_
+
+        done = (numbers[:, nb >> 6] >> numpy.uint64(nb & 63)) & numpy.uint64(1) == 1
+        n[active[done]] = throws
+        d[active[done]] = dices[done]
+        active, numbers = active[~done], numbers[~done]
+
+    return n, d
+
+
+def simulate(compt, nb, seed=None, processes=1, shard_size=1000000):
+    # Répartit les essais en paquets de shard_size avec chacun sa graine dérivée de seed
+    # Le résultat ne dépend donc que de seed et shard_size, pas du nombre de processus
+    shards = [min(shard_size, compt - start) for start in range(0, compt, shard_size)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(shards))
+    tasks = list(zip(shards, [nb] * len(shards), seeds))
+    if processes == 1:
+        results = [simulate_shard(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(simulate_shard, tasks)
+    return (numpy.concatenate([n for n, _ in results] or [numpy.zeros(0, dtype=numpy.int64)]),
+            numpy.concatenate([d for _, d in results] or [numpy.zeros(0, dtype=numpy.int64)]))
+
+
+def simulate_shard(task):
+    compt, nb, seed = task
+    return suite_batch(compt, nb, numpy.random.default_rng(seed))
+
+
+def test(compt, nb, seed=None, processes=1):
+    # n, d = test_loop(compt, nb)
+    n, d = simulate(compt, nb, seed, processes)
     figure = plt.figure(figsize=(10, 10))
     plt.gcf().subplots_adjust(left=0.1, bottom=0.1, right=0.9, top=0.9, wspace=0, hspace=0.2)
     figure.add_subplot(2, 1, 1)  # On ne fait rien avec 'axes', pas besoin de cette variable
@@ -65,6 +122,17 @@ def test(compt, nb):
     return n, d
 
 
+def test_loop(compt, nb):
+    n = []
+    d = []
+    for i in range(compt):
+        # l = suite(nb)
+        l = suite_2(nb)
+        n.append(len(l))
+        d.append(l[-1])     # l[-1] est le dernier élément de l
+    return n, d
+
+
 def solve(target=12, depth=12):
     target = abs(target)
     unsolved_trows = {frozenset({0}): 1}
@@ -85,8 +153,38 @@ def solve(target=12, depth=12):
     return nb_dices_to_target, unsolved_trows
 
 
+# REFLECTIONS[dice][low] envoie le bit n de low (n < dice) sur le bit dice - n, pour calculer abs(n - dice)
+REFLECTIONS = [[sum(1 << (dice - n) for n in range(dice) if low >> n & 1) for low in range(1 << dice)]
+               for dice in range(7)]
+
+
+def solve_bitmask(target=12, depth=12):
+    # Même calcul que solve, mais l'ensemble des totaux atteignables est un entier (le bit n est à 1 si n est atteignable)
+    # On oublie les totaux trop grands pour redescendre jusqu'à target avec les lancers restants, ce qui fusionne des états
+    target = abs(target)
+    target_bit = 1 << target
+    unsolved_trows = {1: 1}
+    nb_dices_to_target = []
+    for remaining in range(depth-1, -1, -1):
+        nb_dices_to_target.append({dice: 0 for dice in range(1, 7)})
+        useful = (1 << (target + 6 * remaining + 1)) - 1
+        unsolved_trows_ = {}
+        for numbers, cases in unsolved_trows.items():
+            for dice in range(1, 7):
+                numbers_ = (numbers << dice | numbers >> dice | REFLECTIONS[dice][numbers & ((1 << dice) - 1)])
+                if numbers_ & target_bit:
+                    nb_dices_to_target[-1][dice] += cases
+                else:
+                    numbers_ &= useful
+                    unsolved_trows_[numbers_] = unsolved_trows_.get(numbers_, 0) + cases
+
+        unsolved_trows = unsolved_trows_
+
+    return nb_dices_to_target, unsolved_trows
+
+
 def main(depth=25):
-    nb_dices_to_target, unsolved_trows = solve(depth=depth)
+    nb_dices_to_target, unsolved_trows = solve_bitmask(depth=depth)
     print(' '.join((f'#lancers', *(f' dernier dé {dice}' for dice in range(1, 7)), f'         total', f'    ratio')))
     for nb_trows, cases in enumerate(nb_dices_to_target, 1):
         print(' '.join((f'{nb_trows: >8}', *(f'{cases[dice]: >13}' for dice in range(1, 7)), f'{sum(cases.values()): >14}', f'{sum(cases.values())/6**nb_trows: .6f}')))
@@ -1,7 +1,10 @@
 
 # See subject at https://www.ilemaths.net/sujet-aurais-je-ma-place-859535.html
 
-from random import randint, choice
+from fractions import Fraction
+from random import randint, choice, randrange
+
+import numpy
 
 
 def simulate(n):
@@ -24,13 +27,100 @@ def simulate(n):
         return False, count + 1
 
 
+def simulate_fast(n):
+    """Same as simulate but the available seats are an array with O(1) swap-remove"""
+    available_seats = list(range(n))
+    positions = list(range(n))  # positions[seat] is the index of seat in available_seats, -1 if taken
+
+    def remove(seat):
+        position, last = positions[seat], available_seats.pop()
+        if last != seat:
+            available_seats[position] = last
+            positions[last] = position
+        positions[seat] = -1
+
+    remove(randrange(n))
+
+    count = 0
+    for i in range(1, n-1):
+        if positions[i] >= 0:
+            remove(i)
+        else:
+            count += 1
+            remove(available_seats[randrange(len(available_seats))])
+
+    if positions[n-1] >= 0:
+        return True, count
+    else:
+        return False, count + 1
+
+
+def simulate_chunk(n, t, rng):
+    """Run t boarding processes of simulate(n) in lockstep, return the arrays of available and count"""
+    rows = numpy.arange(t)
+    available_seats = numpy.tile(numpy.arange(n, dtype=numpy.int32), (t, 1))  # Free seats are the first free[row]
+    positions = available_seats.copy()  # positions[row, seat] is the index of seat in available_seats[row], -1 if taken
+    free = numpy.full(t, n, dtype=numpy.int32)
+
+    def remove(rows, seats):
+        position, last = positions[rows, seats], available_seats[rows, free[rows] - 1]
+        available_seats[rows, position] = last
+        positions[rows, last] = position
+        positions[rows, seats] = -1
+        free[rows] -= 1
+
+    remove(rows, rng.integers(0, n, size=t))
+
+    count = numpy.zeros(t, dtype=numpy.int32)
+    for i in range(1, n-1):
+        seated = positions[:, i] >= 0
+        remove(rows[seated], i)
+        displaced = rows[~seated]
+        count[displaced] += 1
+        remove(displaced, available_seats[displaced, rng.integers(0, free[displaced])])
+
+    available = positions[:, n-1] >= 0
+    return available, count + ~available
+
+
+def simulate_batch(n, t, seed=None, chunk_size=1000000):
+    """Yield the (available, count) arrays of t runs of simulate(n) by chunks of at most chunk_size runs"""
+    rng = numpy.random.default_rng(seed)
+    for start in range(0, t, chunk_size):
+        yield simulate_chunk(n, min(chunk_size, t - start), rng)
+
+
+def distribution(n, exact=False):
+    """Return p such that p[available, count] is the probability that simulate(n) returns (available, count)
+
+    When passenger j is displaced, the free seats are seat 0 (the chain stops) and the seats j+1 to n-1 (passenger k is
+    displaced next). suffix accumulates, from the end, the distributions of the displacement chains starting at j.
+    """
+    one = Fraction(1) if exact else 1.0
+    dtype = object if exact else float
+
+    # Stored as suffix[count, available] so that the slices below are contiguous
+    suffix = numpy.zeros((n+1, 2), dtype=dtype)
+    chains = numpy.zeros((n+1, 2), dtype=dtype)
+    suffix[1, 0] = one  # The last passenger is displaced
+    for j in range(n-2, 0, -1):
+        weight = one / (n-j)
+        numpy.multiply(suffix[:n-j], weight, out=chains[:n-j])
+        suffix[1:n-j+1] += chains[:n-j]
+        suffix[1, 1] += weight  # Seat 0 is taken
+
+    probabilities = suffix.T
+    probabilities[1, 0] += one  # The first passenger takes seat 0
+    return probabilities * (one / n)
+
+
 def main():
     n = 10
     t = 100000
     total = 0
     count_ = 0
     for _ in range(t):
-        available, count = simulate(n)
+        available, count = simulate_fast(n)
         total += count
         if not available:
             count_ += 1
@@ -39,6 +129,17 @@ def main():
     print(total/t)
     print(sum(1/i for i in range(2, n+1)))
 
+    count_, total = 0, 0
+    for available, count in simulate_batch(n, 100 * t, seed=0):
+        count_ += numpy.count_nonzero(~available)
+        total += count.sum()
+    print(count_/(100 * t))
+    print(total/(100 * t))
+
+    probabilities = distribution(n, exact=True)
+    print(sum(probabilities[0]))
+    print(sum(probabilities.sum(axis=0) * numpy.arange(n+1)))
+
 
 if __name__ == "__main__":
     main()
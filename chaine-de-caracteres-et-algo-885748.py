@@ -1,10 +1,19 @@
 # See https://www.ilemaths.net/sujet-chaine-de-caracteres-et-algo-885748.html
 import cProfile
+import json
+import tracemalloc
+from datetime import datetime
 from functools import reduce
+from hashlib import sha1
+from inspect import getsource
+from io import StringIO
 from itertools import chain, groupby
 from random import choices, shuffle
+from statistics import quantiles
 from string import ascii_uppercase, digits
-from timeit import timeit
+from timeit import repeat as repeat_timeit
+
+import numpy
 
 
 def replace_letters(message):
@@ -181,6 +190,65 @@ def replace_letters_5(message):
     return ''.join(modified_message)
 
 
+def replace_letters_6(message):
+    if message.isascii():
+        codes = numpy.frombuffer(message.encode('ascii'), dtype=numpy.uint8)
+    else:
+        codes = numpy.frombuffer(message.encode('utf-32-le'), dtype=numpy.uint32)
+    digit_values = codes - codes.dtype.type(ord('0'))  # Wraps around below '0'
+    is_digit = digit_values < 10
+
+    # Position of each letter in its run, as in replace_letters (0 for the digits).
+    # Arithmetic on the masks is much faster than numpy.where on random data.
+    indexes = numpy.arange(1, len(codes) + 1, dtype=numpy.int32)
+    positions = indexes - numpy.maximum.accumulate(numpy.multiply(indexes, is_digit, dtype=numpy.int32))
+
+    # Last digit of each number, then insert the other digits of the (rare) numbers >= 10 before it
+    modified_message = positions.astype(numpy.uint8) + numpy.uint8(ord('0'))
+    modified_message += numpy.multiply(digit_values, is_digit, dtype=digit_values.dtype).astype(numpy.uint8)
+    long_numbers = numpy.flatnonzero(positions >= 10)
+    if len(long_numbers):
+        numbers = positions[long_numbers]
+        modified_message[long_numbers] = numbers % 10 + ord('0')
+        insert_indexes, insert_digits = [], []
+        power = 10 ** (len(str(numbers.max())) - 1)
+        while power >= 10:
+            long_enough = numbers >= power
+            insert_indexes.append(long_numbers[long_enough])
+            insert_digits.append(numbers[long_enough] // power % 10 + ord('0'))
+            power //= 10
+        insert_indexes = numpy.concatenate(insert_indexes)
+        order = numpy.argsort(insert_indexes, kind='stable')  # Most significant digits first
+        modified_message = numpy.insert(modified_message, insert_indexes[order],
+                                        numpy.concatenate(insert_digits)[order].astype(numpy.uint8))
+
+    return modified_message.tobytes().decode('ascii')
+
+
+def replace_letters_stream(source, destination, chunk_size=1 << 20):
+    """Same as replace_letters_5 from a text stream to another, chunk_size characters at a time.
+
+    Binary streams can be wrapped in io.TextIOWrapper(stream, newline='').
+    """
+    letters = 0  # Length of the letters run at the end of the previous chunk, 0 if it ended in digits
+    while chunk := source.read(chunk_size):
+        modified_chunk = []
+        for i, group in enumerate(group_digits(chunk)):
+            if i & 1:
+                modified_chunk.append(''.join(map(str, range(letters + 1, letters + group + 1))))
+                letters += group
+            elif group:
+                modified_chunk.append(group)
+                letters = 0
+        destination.write(''.join(modified_chunk))
+
+
+def replace_letters_file(source_path, destination_path, chunk_size=1 << 20, encoding='utf-8'):
+    with (open(source_path, encoding=encoding, newline='') as source,
+          open(destination_path, 'w', encoding=encoding, newline='') as destination):
+        replace_letters_stream(source, destination, chunk_size)
+
+
 def generate_message(nb_letters, nb_digits):
     message = choices(ascii_uppercase, k=nb_letters) + choices(digits, k=nb_digits)
     shuffle(message)
@@ -195,6 +263,7 @@ ALGORITHMS = [
     # flight_with_acc,
     replace_letters_4,
     replace_letters_5,
+    replace_letters_6,
 ]
 
 
@@ -202,23 +271,60 @@ def validate(message='6930A85CDU744ZABR09', expected_result='6930185123744123409
     for algorithm in ALGORITHMS:
         assert algorithm(message) == expected_result
 
+    for chunk_size in range(1, len(message) + 1):
+        destination = StringIO()
+        replace_letters_stream(StringIO(message), destination, chunk_size)
+        assert destination.getvalue() == expected_result
 
-def compare_times():
-    print('length', *(algorithm.__name__ for algorithm in ALGORITHMS))
 
-    for n in range(6):
-        length = 10 ** n
-        messages = [generate_message(length // 2, length - length // 2) for _ in range(10)]
+def measure(algorithm, messages, number, repeat=5):
+    """Return the timings (s per message) of repeat runs, after a warm-up run, and the peak memory of one run"""
+    def run():
+        for message in messages:
+            algorithm(message)
 
-        nb_tests = 100000 // length
+    run()
+    times = [t / (number * len(messages)) for t in repeat_timeit(run, number=number, repeat=repeat)]
 
-        times = [
-            timeit(stmt=f'list({algorithm.__name__}(message) for message in {messages})',
-                   setup=f'from __main__ import {algorithm.__name__}', number=nb_tests)
-            for algorithm in ALGORITHMS
-        ]
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
 
-        print(f"{length:>7}", *(f"{t * 100 / nb_tests:>7.3f}" for t in times))
+    return times, peak_memory
+
+
+def compare_times(max_length=10 ** 6, repeat=5, history_path='benchmark_history.jsonl'):
+    """Print the median and IQR of the time per message (ms) and the peak memory (KiB) of each algorithm per length
+
+    Each measure is appended to history_path (one JSON object per line) with a hash of the algorithm source code, so
+    the timings of the successive versions of an algorithm can be compared.
+    """
+    if repeat < 2:
+        raise ValueError(f"At least 2 repeats are needed for the quartiles, got {repeat}")
+    print(f"{'length':>7} {'algorithm':<17} {'median':>9} {'iqr':>9} {'peak KiB':>9}")
+    date = datetime.now().isoformat(timespec='seconds')
+    versions = {algorithm: sha1(getsource(algorithm).encode()).hexdigest()[:12] for algorithm in ALGORITHMS}
+
+    length = 1
+    while length <= max_length:
+        messages = [generate_message(length // 2, length - length // 2) for _ in range(10)]
+        number = max(1, 10000 // length)
+
+        for algorithm in ALGORITHMS:
+            times, peak_memory = measure(algorithm, messages, number, repeat)
+            q1, median, q3 = quantiles(times, n=4)
+            print(f"{length:>7} {algorithm.__name__:<17} {median * 1000:>9.3f} {(q3 - q1) * 1000:>9.3f} "
+                  f"{peak_memory / 1024:>9.1f}")
+            if history_path is not None:
+                with open(history_path, 'a') as history:
+                    history.write(json.dumps({
+                        'date': date, 'algorithm': algorithm.__name__, 'version': versions[algorithm],
+                        'length': length, 'repeat': repeat, 'median': median, 'iqr': q3 - q1,
+                        'peak_memory': peak_memory,
+                    }) + '\n')
+
+        length *= 10
 
     print()
 
@@ -227,7 +333,9 @@ def profile():
     messages = [generate_message(50000, 50000) for _ in range(100)]
     for algorithm in ALGORITHMS:
         print(algorithm.__name__)
-        cProfile.run(statement=f'list({algorithm.__name__}(message) for message in {messages})', sort='cumulative')
+        profiler = cProfile.Profile()
+        profiler.runcall(lambda: [algorithm(message) for message in messages])
+        profiler.print_stats(sort='cumulative')
 
 
 def main():
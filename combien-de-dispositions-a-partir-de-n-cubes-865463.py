@@ -1,31 +1,154 @@
 
 # See subject at https://www.ilemaths.net/sujet-combien-de-dispositions-a-partir-de-n-cubes-865463.html
 
+from array import array
+from functools import cache
 from math import factorial
+from multiprocessing import Pool
 from time import perf_counter
-from functools import cache
+
+import numpy
 
 
 class Solid:
 
+    __slots__ = ('dimension', 'key', 'number_of_permutations')
+
     even_permutations = [[()]]
     odd_permutations = [[]]
     gray_codes: list[list[tuple[int, ...]]] = [[()]]
 
+    # Rotation tables are used when the tables of all the rotations hold at most this number of packed cubes
+    max_table_size = 1 << 16
+
     def __init__(self, cubes):
-        ordered_avatars = frozenset(Solid.gen_avatars(cubes))
-        avatars = frozenset(map(frozenset, ordered_avatars))
-        self.cubes = tuple(min(map(sorted, avatars)))
-        self.number_of_permutations = len(ordered_avatars) // len(avatars)
+        # Each cube is packed in one int with bits coordinates, the first coordinate in the most significant bits so
+        # that the packed ints are sorted as the cubes. The solid is the bytes of its sorted packed cubes.
+        dimension, bits = len(cubes[0]), Solid.get_bits(len(cubes))
+        mins = [min(cube[d] for cube in cubes) for d in range(dimension)]
+        extents = [max(cube[d] for cube in cubes) - mins[d] for d in range(dimension)]
+        packed = [sum((cube[d] - mins[d]) << (bits * (dimension - 1 - d)) for d in range(dimension)) for cube in cubes]
+
+        tables = Solid.get_rotation_tables(dimension, bits)
+        if tables is None:
+            self.key, self.number_of_permutations = Solid.canonicalize_batched(cubes, bits)
+        else:
+            ordered_avatars, avatars = set(), set()
+            for table, offsets in zip(tables, Solid.get_rotation_offsets(dimension, bits)):
+                # The rotations reflect the coordinates in [0, 2**bits - 1]: move the avatar back to the origin
+                offset = sum(extent_offsets[extents[d]] for d, extent_offsets in offsets)
+                avatar = tuple(table[cube] - offset for cube in packed)
+                ordered_avatars.add(avatar)
+                avatars.add(tuple(sorted(avatar)))
+            self.key = array(Solid.get_typecode(dimension), min(avatars)).tobytes()
+            self.number_of_permutations = len(ordered_avatars) // len(avatars)
+        self.dimension = dimension
+
+    @staticmethod
+    def canonicalize_batched(cubes, bits):
+        """Same key and number of permutations as the tables, all the avatars being computed in one matmul
+
+        Packing is linear, so the packed avatars are the cubes times the packed rotation matrices minus the packed
+        minimum of each rotated coordinate, itself a matmul of the minimum and maximum of each coordinate.
+        """
+        dimension = len(cubes[0])
+        packing, positive, negative = Solid.get_packed_rotation_matrices(dimension, bits)
+        coordinates = numpy.array(cubes, dtype=numpy.int64)
+        minimums, maximums = coordinates.min(axis=0), coordinates.max(axis=0)
+        ordered_avatars = packing @ coordinates.T - (positive @ minimums - negative @ maximums)[:, None]
+        avatars = numpy.sort(ordered_avatars, axis=1)
+
+        # Count the rotations leaving the solid and each of its cubes in place
+        identity = (coordinates - minimums) @ (1 << bits * numpy.arange(dimension - 1, -1, -1))
+        solid_stabilizer = numpy.count_nonzero((avatars == numpy.sort(identity)).all(axis=1))
+        cubes_stabilizer = numpy.count_nonzero((ordered_avatars == identity).all(axis=1))
+
+        # Lexicographic minimum, column by column
+        for column in range(avatars.shape[1]):
+            avatars = avatars[avatars[:, column] == avatars[:, column].min()]
+        key = array(Solid.get_typecode(dimension), avatars[0].tolist()).tobytes()
+        return key, solid_stabilizer // cubes_stabilizer
 
     def __eq__(self, other):
-        return other and self.cubes == other.cubes
+        return other and self.key == other.key and self.dimension == other.dimension
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return hash(self.cubes)
+        return hash(self.key)
+
+    @property
+    def cubes(self):
+        packed = array(Solid.get_typecode(self.dimension), self.key)
+        bits = Solid.get_bits(len(packed))
+        mask = (1 << bits) - 1
+        return tuple(tuple(cube >> (bits * (self.dimension - 1 - d)) & mask for d in range(self.dimension))
+                     for cube in packed)
+
+    @staticmethod
+    def get_bits(nb_cubes):
+        assert nb_cubes <= 16
+        return max(1, (nb_cubes - 1).bit_length())
+
+    @staticmethod
+    def get_typecode(dimension):
+        # Up to 4 bits per coordinate (16 cubes)
+        return next(typecode for typecode in 'BHIQ' if 4 * dimension <= 8 * array(typecode).itemsize)
+
+    @staticmethod
+    def gen_rotations(dimension):
+        for permutation in Solid.even_permutations[dimension]:
+            for code in Solid.gray_codes[dimension][::2]:
+                yield permutation, code
+        for permutation in Solid.odd_permutations[dimension]:
+            for code in Solid.gray_codes[dimension][1::2]:
+                yield permutation, code
+
+    @staticmethod
+    @cache
+    def get_rotation_matrices(dimension):
+        """Stack of the matrices of the rotations of the hyperoctahedral group"""
+        rotations = list(Solid.gen_rotations(dimension))
+        matrices = numpy.zeros((len(rotations), dimension, dimension), dtype=numpy.int64)
+        for matrix, (permutation, code) in zip(matrices, rotations):
+            matrix[range(dimension), permutation] = code
+        return matrices
+
+    @staticmethod
+    @cache
+    def get_packed_rotation_matrices(dimension, bits):
+        """The rows packing the rotated coordinates of a cube, and their positive and negative parts"""
+        packing = (1 << bits * numpy.arange(dimension - 1, -1, -1)) @ Solid.get_rotation_matrices(dimension)
+        return packing, numpy.maximum(packing, 0), numpy.maximum(-packing, 0)
+
+    @staticmethod
+    @cache
+    def get_rotation_offsets(dimension, bits):
+        """For each rotation, the offsets (as (source axis, offset by extent)) to move a reflected avatar back to the
+        origin"""
+        mask = (1 << bits) - 1
+        shifts = [bits * (dimension - 1 - d) for d in range(dimension)]
+        return tuple(tuple((permutation[d], tuple((mask - extent) << shifts[d] for extent in range(mask + 1)))
+                           for d in range(dimension) if code[d] < 0)
+                     for permutation, code in Solid.gen_rotations(dimension))
+
+    @staticmethod
+    @cache
+    def get_rotation_tables(dimension, bits):
+        """For each rotation, the table of the rotated packed cubes, or None if the tables would be too large
+
+        The rotations reflect the coordinates in [0, 2**bits - 1], so the tables are the packed rotation matrices times
+        the coordinates of every packed cube plus the packed mask of the reflected coordinates.
+        """
+        size, mask = 1 << (bits * dimension), (1 << bits) - 1
+        packing, _, negative = Solid.get_packed_rotation_matrices(dimension, bits)
+        if len(packing) * size > Solid.max_table_size:
+            return None
+        coordinates = numpy.arange(size)[:, None] >> bits * numpy.arange(dimension - 1, -1, -1) & mask
+        tables = packing @ coordinates.T + (negative @ numpy.full(dimension, mask))[:, None]
+        typecode = Solid.get_typecode(dimension)
+        return tuple(array(typecode, table.tolist()) for table in tables)
 
     @staticmethod
     def create_permutations(dimension):
@@ -54,44 +177,81 @@ class Solid:
             codes += [(-1,) + code for code in reversed(Solid.gray_codes[d])]
             Solid.gray_codes.append(codes)
 
-    @staticmethod
-    def gen_avatars(cubes):
-        for rotation in zip(*map(Solid.get_rotations, cubes)):
-            yield Solid.move_to_origin(rotation)
-
-    @staticmethod
-    def move_to_origin(cubes):
-        min_xs = tuple(min(cube[d] for cube in cubes) for d in range(len(cubes[0])))
-        return tuple(tuple(c - min_xs[d] for d, c in enumerate(cube)) for cube in cubes)
-
     def add_cube(self):
-        for cube in self.cubes:
+        cubes = self.cubes
+        for cube in cubes:
             for new_cube in Solid.gen_translations(cube):
-                if new_cube not in self.cubes:
-                    yield Solid(self.cubes + (new_cube,))
+                if new_cube not in cubes:
+                    yield Solid(cubes + (new_cube,))
 
     def add_dimension(self):
         return Solid(tuple(cube + (0,) for cube in self.cubes))
 
-    @staticmethod
-    @cache
-    def get_rotations(cube):
-        d = len(cube)
-        rotations = []
-        for permutation in Solid.even_permutations[d]:
-            for code in Solid.gray_codes[d][::2]:
-                rotations.append(tuple(cube[permutation[i]] * code[i] for i in range(len(cube))))
-        for permutation in Solid.odd_permutations[d]:
-            for code in Solid.gray_codes[d][1::2]:
-                rotations.append(tuple(cube[permutation[i]] * code[i] for i in range(len(cube))))
-        return tuple(rotations)
-
     @staticmethod
     def gen_translations(cube):
         for d in range(len(cube)):
             yield cube[:d] + (cube[d] - 1,) + cube[d+1:]
             yield cube[:d] + (cube[d] + 1,) + cube[d + 1:]
 
+    def gen_children(self, add_dimension):
+        """Generate the solids with one more cube whose parent is this solid, each exactly once
+
+        The parent of a solid is the solid without the last cube of its canonical form that keeps it connected. As in
+        main, the cube is added before the dimension. The parents of the candidates are only built when their
+        invariants match this solid.
+        """
+        cubes = self.cubes
+        invariants = Solid.get_invariants(cubes)
+        seen, children = set(), set()
+        for cube in cubes:
+            for new_cube in Solid.gen_translations(cube):
+                if new_cube in cubes:
+                    continue
+                child = Solid(cubes + (new_cube,))
+                if child in seen:
+                    continue
+                seen.add(child)
+                if add_dimension:
+                    child = child.add_dimension()
+                    if child in children:
+                        continue
+                children.add(child)
+
+                remaining = child.get_parent_cubes()
+                if add_dimension:
+                    # The parent spans fewer axes than this solid's dimension, where it has no mirror image: it can be
+                    # compared to this solid without one of its constant axes
+                    axis = next(d for d in range(self.dimension + 1) if len({cube[d] for cube in remaining}) == 1)
+                    remaining = tuple(cube[:axis] + cube[axis + 1:] for cube in remaining)
+                if Solid.get_invariants(remaining) == invariants and Solid(remaining) == self:
+                    yield child
+
+    def get_parent_cubes(self):
+        cubes = self.cubes
+        for i in reversed(range(len(cubes))):
+            remaining = cubes[:i] + cubes[i+1:]
+            if Solid.is_connected(remaining):
+                return remaining
+
+    @staticmethod
+    def get_invariants(cubes):
+        """Sorted extents and numbers of neighbours of the cubes, the same for the cubes of equal solids"""
+        extents = sorted(max(cube[d] for cube in cubes) - min(cube[d] for cube in cubes) for d in range(len(cubes[0])))
+        cubes_set = set(cubes)
+        neighbours = sorted(sum(neighbour in cubes_set for neighbour in Solid.gen_translations(cube)) for cube in cubes)
+        return extents, neighbours
+
+    @staticmethod
+    def is_connected(cubes):
+        remaining = set(cubes[1:])
+        stack = [cubes[0]]
+        while stack:
+            for neighbour in Solid.gen_translations(stack.pop()):
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        return not remaining
+
 
 def main(max_nb_cubes, dimensions):
     start = perf_counter()
@@ -111,6 +271,57 @@ def main(max_nb_cubes, dimensions):
         print(f"{nb_cubes}: {len(solids)} ({number_of_colored_solids}) {perf_counter()-start:3.3f}s")
 
 
+def count_descendants(solid, nb_cubes, max_nb_cubes, dimensions):
+    """Return the number of solids and colored solids for each number of cubes in nb_cubes+1..max_nb_cubes
+    descending from solid (which has nb_cubes cubes)"""
+    counts = [[0, 0] for _ in range(max_nb_cubes - nb_cubes)]
+    stack = [(solid, nb_cubes)]
+    while stack:
+        solid, nb_cubes_ = stack.pop()
+        if nb_cubes_ == max_nb_cubes:
+            continue
+        for child in solid.gen_children(nb_cubes_ < dimensions):
+            counts[nb_cubes_ - nb_cubes][0] += 1
+            counts[nb_cubes_ - nb_cubes][1] += factorial(nb_cubes_ + 1) // child.number_of_permutations
+            stack.append((child, nb_cubes_ + 1))
+    return counts
+
+
+def count_subtree(task):
+    solid, nb_cubes, max_nb_cubes, dimensions = task
+    Solid.create_permutations(dimensions)
+    Solid.create_gray_codes(dimensions)
+    return count_descendants(solid, nb_cubes, max_nb_cubes, dimensions)
+
+
+def main_parallel(max_nb_cubes, dimensions, split_nb_cubes=5, processes=None):
+    """Same counts as main, each solid being generated once from its parent, the subtrees split over a process pool"""
+    start = perf_counter()
+    Solid.create_permutations(dimensions)
+    Solid.create_gray_codes(dimensions)
+    print(f"Solids in dimension {dimensions}:")
+    print(f"{1}: {1} ({1}) {perf_counter()-start:3.3f}s")
+
+    # The first levels are enumerated directly, the solids with split_nb_cubes cubes are the roots of the subtrees
+    split_nb_cubes = min(split_nb_cubes, max_nb_cubes)
+    counts = [[0, 0] for _ in range(max_nb_cubes - 1)]
+    solids = [Solid([(0,)])]
+    for nb_cubes in range(2, split_nb_cubes + 1):
+        solids = [child for solid in solids for child in solid.gen_children(nb_cubes <= dimensions)]
+        counts[nb_cubes - 2] = [len(solids), sum(factorial(nb_cubes) // solid.number_of_permutations
+                                                for solid in solids)]
+
+    with Pool(processes) as pool:
+        tasks = ((solid, split_nb_cubes, max_nb_cubes, dimensions) for solid in solids)
+        for subtree_counts in pool.imap_unordered(count_subtree, tasks, chunksize=16):
+            for level, (count, colored) in enumerate(subtree_counts, split_nb_cubes - 1):
+                counts[level][0] += count
+                counts[level][1] += colored
+
+    for nb_cubes, (count, colored) in enumerate(counts, 2):
+        print(f"{nb_cubes}: {count} ({colored}) {perf_counter()-start:3.3f}s")
+
+
 if __name__ == "__main__":
     main(10, 1)
     main(10, 2)
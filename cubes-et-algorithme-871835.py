@@ -3,10 +3,17 @@
 
 from bisect import bisect_left, bisect_right
 from collections import defaultdict
-from heapq import heappop, heappush
+from functools import cache
+from heapq import heapify, heappop, heappush, heapreplace, merge
+from itertools import groupby
+from operator import itemgetter
+from time import perf_counter
 
+import numpy
+from numpy.lib.format import open_memmap
 
-def solve(n, k):
+
+def solve(n, k, best=9):
 
     powers = []
     i = 0
@@ -17,7 +24,6 @@ def solve(n, k):
     # Nodes are (cost, remainder, -terms)
     heap: list[tuple[int, int, tuple[int, ...]]]
     heap = [(1, n, ())]
-    best = 9
     while heap:
         # print(heap)
         cost, n, terms = heappop(heap)
@@ -39,6 +45,40 @@ def solve(n, k):
             heappush(heap, (cost, n - power, terms + (-term,)))
 
 
+def solve_range(max_n, k, path=None):
+    """Minimal number of k-th powers summing to each n <= max_n, as an array of the smallest unsigned dtype that holds
+    Waring's g(k) + 1
+
+    Each pass lowers every count using one more power, until a pass changes nothing, so the number of passes is
+    bounded by the largest count. With a path, the table is built directly in a memory-mappable .npy file.
+    """
+    powers = [p for i in range(2, int(max_n ** (1 / k)) + 2) if (p := i**k) <= max_n]
+    # Every n is a sum of at most g(k) k-th powers (the ideal Waring number, proven for all k up to 471 600 000)
+    bound = 2**k + 3**k // 2**k - 2
+    dtype = numpy.min_scalar_type(bound + 1)
+    if path is None:
+        counts = numpy.empty(max_n + 1, dtype=dtype)
+    else:
+        counts = open_memmap(path, mode='w+', dtype=dtype, shape=(max_n + 1,))
+
+    # Only ones at first, capped by g(k) so that adding a term never overflows
+    counts[:] = numpy.minimum(numpy.arange(max_n + 1), bound)
+    previous = None
+    while previous is None or not numpy.array_equal(previous, counts):
+        previous = counts.copy()
+        for p in powers:
+            numpy.minimum(counts[p:], counts[:-p] + 1, out=counts[p:])
+
+    if path is not None:
+        counts.flush()
+    return counts
+
+
+def load_range(path):
+    """Memory-map a table saved by solve_range for queries"""
+    return numpy.load(path, mmap_mode='r')
+
+
 def solve2(n, k):
     # Find all solutions with a number of terms of 4 or less
     sums = {}
@@ -77,6 +117,140 @@ def solve3(n, k):
                     yield i_a + i_b + s[n - p_a - p_b]
 
 
+@cache
+def get_residues(k, terms, modulus):
+    """For each number of terms up to terms, the residues modulo modulus of the sums of that many k-th powers"""
+    powers = {pow(i, k, modulus) for i in range(modulus)}
+    residues = [{0}]
+    for _ in range(terms):
+        residues.append({(r + p) % modulus for r in residues[-1] for p in powers})
+    return residues
+
+
+def gen_sorted_sums(powers, classes, limit, descending=False):
+    """Yield (sum, bases) of one base from each of the 0, 1 or 2 sorted lists classes (bases non increasing), sorted by
+    sum, up to limit
+
+    Pairs come from a heap holding one entry per smallest base when increasing (per largest base when decreasing),
+    as in Bernstein's sorted sums, so memory stays O(len(larger) + len(smaller)).
+    """
+    if not classes:
+        yield 0, ()
+        return
+    if len(classes) == 1:
+        bases = classes[0][:bisect_right(classes[0], bisect_right(powers, limit) - 1)]
+        for i in reversed(bases) if descending else bases:
+            yield powers[i], (i,)
+        return
+
+    # Entries are (sum, position of the largest base, position of the smallest base), sum negated when decreasing
+    larger, smaller = classes
+    sign = -1 if descending else 1
+    if descending:
+        # Start each largest base with the largest smallest base keeping the sum up to limit
+        heap = [(p, q) for p, i in enumerate(larger) if powers[i] <= limit
+                and (q := bisect_right(smaller, min(i, bisect_right(powers, limit - powers[i]) - 1)) - 1) >= 0]
+    else:
+        heap = [(p, q) for q, j in enumerate(smaller) if (p := bisect_left(larger, j)) < len(larger)]
+    heap = [(sign * (powers[larger[p]] + powers[smaller[q]]), p, q) for p, q in heap]
+    heapify(heap)
+    while heap:
+        s, p, q = heap[0]
+        if sign * s > limit:
+            return
+        yield sign * s, (larger[p], smaller[q])
+        if descending:
+            q -= 1
+        else:
+            p += 1
+        if 0 <= q and p < len(larger):
+            heapreplace(heap, (sign * (powers[larger[p]] + powers[smaller[q]]), p, q))
+        else:
+            heappop(heap)
+
+
+def gen_residue_classes(classes, terms, residue, modulus):
+    """Yield the tuples of terms lists of bases (from classes, by residue of their k-th power) whose k-th powers sum to
+    residue modulo modulus"""
+    if terms == 0:
+        if residue == 0:
+            yield ()
+    elif terms == 1:
+        if residue in classes:
+            yield classes[residue],
+    else:
+        for first, bases in classes.items():
+            if (second := (residue - first) % modulus) in classes:
+                yield bases, classes[second]
+
+
+def gen_representations(n, k, terms, max_base, powers, modulus=None):
+    """Yield the tuples of terms non increasing bases at most max_base whose k-th powers (powers[base]) sum to n"""
+    residues = get_residues(k, terms, modulus) if modulus else None
+    if residues and n % modulus not in residues[terms]:
+        return
+    max_base = min(max_base, bisect_right(powers, n) - 1)
+
+    if terms > 4:
+        # Enumerate the largest term, the remainder is left to the meet in the middle
+        for i in range(max_base, -1, -1):
+            if terms * powers[i] < n:
+                break
+            for rest in gen_representations(n - powers[i], k, terms - 1, i, powers, modulus):
+                yield (i,) + rest
+        return
+
+    # Split the bases by residue of their k-th power, like solve3, and only sweep the sums of residue classes that
+    # can meet modulo modulus
+    modulus = modulus or 1
+    classes = defaultdict(list)
+    for i in range(max_base + 1):
+        classes[powers[i] % modulus].append(i)
+    right_terms = terms // 2
+    left_terms = terms - right_terms
+    for left_residue in range(modulus):
+        right_residue = (n - left_residue) % modulus
+        left = [gen_sorted_sums(powers, left_classes, n)
+                for left_classes in gen_residue_classes(classes, left_terms, left_residue, modulus)]
+        right = [gen_sorted_sums(powers, right_classes, n, descending=True)
+                 for right_classes in gen_residue_classes(classes, right_terms, right_residue, modulus)]
+        if not left or not right:
+            continue
+        left = merge(*left, key=itemgetter(0))
+        right = merge(*right, key=itemgetter(0), reverse=True)
+
+        # Two-pointer sweep over the groups of equal sums
+        left, right = groupby(left, key=itemgetter(0)), groupby(right, key=itemgetter(0))
+        left_group, right_group = next(left, None), next(right, None)
+        while left_group and right_group:
+            s = left_group[0] + right_group[0]
+            if s < n:
+                left_group = next(left, None)
+            elif s > n:
+                right_group = next(right, None)
+            else:
+                right_bases = [bases for _, bases in right_group[1]]
+                for _, bases in left_group[1]:
+                    for other_bases in right_bases:
+                        if not other_bases or bases[-1] >= other_bases[0]:
+                            yield bases + other_bases
+                left_group, right_group = next(left, None), next(right, None)
+
+
+def solve_mitm(n, k, terms=4, modulus=None):
+    """Find all solutions with a number of terms of terms or less, zeros included (like solve2)
+
+    Memory is O(n^(1/k)) instead of the O(n^(2/k)) dict of solve2. With a modulus (63 for cubes, as in solve3), the
+    bases are split by residue of their k-th power and only the sums of residue classes meeting n modulo it are swept.
+    """
+    powers = []
+    i = 0
+    while (p := i**k) <= n:
+        powers.append(p)
+        i += 1
+    yield from gen_representations(n, k, terms, len(powers) - 1, powers, modulus)
+
+
 def main():
     n = int(input("Entrez un nombre: "))
     k = 3
@@ -84,5 +258,20 @@ def main():
         print(' + '.join(f'{term}^{k}' for term in terms) + f' = {sum(term**k for term in terms)}')
 
 
+def main_range(max_n=10**7, k=3, path=None):
+    start = perf_counter()
+    counts = solve_range(max_n, k, path)
+    print(f"Minimal number of {k}-th powers up to {max_n}: {perf_counter()-start:3.3f}s")
+    for nb_terms, nb in enumerate(numpy.bincount(counts)):
+        if nb:
+            print(f"{nb_terms} terms: {nb}")
+
+    # Witnesses of the largest counts, from the heap search bounded by the table
+    for n in numpy.flatnonzero(counts == counts.max())[-5:]:
+        n = int(n)
+        terms = next(solve(n, k, best=int(counts[n])))
+        print(' + '.join(f'{term}^{k}' for term in terms) + f' = {n}')
+
+
 if __name__ == "__main__":
     main()
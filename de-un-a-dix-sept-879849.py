@@ -1,22 +1,61 @@
 
 # See subject at https://www.ilemaths.net/sujet-de-un-a-dix-sept-879849.html
 
+import csv
+from collections import defaultdict
 from itertools import combinations
 from fractions import Fraction
+from math import comb
 
 
 def has_sum(tokens, target_sum):
-    sums = {0}
+    # Bit s of sums is set when s is the sum of a non empty subset of the tokens
+    if target_sum < 0:
+        return False
+    mask = (1 << target_sum + 1) - 1
+    sums = 0
     for token in tokens:
-        new_sums = set()
-        for s in sums:
-            new_sum = token + s
-            if new_sum == target_sum:
-                return True
-            if new_sum <= target_sum:
-                new_sums.add(new_sum)
-        sums |= new_sums
-    return False
+        sums = (sums | (sums | 1) << token) & mask
+    return bool(sums >> target_sum & 1)
+
+
+def gen_success_counts(max_tokens, target_sum, max_taken=None):
+    """For tokens = 0..max_tokens, yield the numbers of subsets of 1..tokens of each size up to max_taken
+    having a part summing to target_sum
+
+    Other subsets are counted by (size, reachable sums below target_sum as an int bitset), so the subsets are never
+    enumerated. Tokens above target_sum do not change the reachable sums, so they are only counted by binomials.
+    """
+    if max_taken is None:
+        max_taken = max_tokens
+    mask = (1 << target_sum) - 1
+    states = {(0, 1): 1}
+    successes = [0] * (max_taken + 1)
+    yield successes
+    for token in range(1, min(max_tokens, target_sum) + 1):
+        new_states = defaultdict(int, states)
+        new_successes = successes.copy()
+        for size in range(max_taken):
+            new_successes[size + 1] += successes[size]
+        for (size, sums), nb in states.items():
+            if size == max_taken:
+                continue
+            new_sums = sums | sums << token
+            if new_sums >> target_sum & 1:
+                new_successes[size + 1] += nb
+            else:
+                new_states[size + 1, new_sums & mask] += nb
+        states, successes = new_states, new_successes
+        yield successes
+
+    for large_tokens in range(1, max_tokens - target_sum + 1):
+        yield [sum(successes[size] * comb(large_tokens, taken - size) for size in range(taken + 1))
+               for taken in range(max_taken + 1)]
+
+
+def probability(taken_tokens=5, tokens=17, target_sum=18):
+    *_, successes = gen_success_counts(tokens, target_sum, taken_tokens)
+    return Fraction(successes[taken_tokens], comb(tokens, taken_tokens))
 
 
 def main(taken_tokens=5, tokens=17, target_sum=18):
@@ -27,7 +66,61 @@ def main(taken_tokens=5, tokens=17, target_sum=18):
     return Fraction(reussite, total)
 
 
+def main_table(max_tokens=100, target_sums=(18, 24, 30), max_taken=10):
+    for target_sum in target_sums:
+        print(f"Target sum {target_sum}:")
+        print("tokens " + " ".join(f"{taken:5}" for taken in range(1, max_taken + 1)))
+        for tokens, successes in enumerate(gen_success_counts(max_tokens, target_sum, max_taken)):
+            if tokens:
+                print(f"{tokens:6} " + " ".join(
+                    f"{successes[taken] / comb(tokens, taken):5.3f}" if taken <= tokens else "    -"
+                    for taken in range(1, max_taken + 1)))
+
+
+def sweep(max_tokens=17, target_sums=(18,), path='de-un-a-dix-sept.csv'):
+    """Write the probability of every (taken_tokens, tokens, target_sum) with tokens <= max_tokens as CSV
+
+    The subsets of 1..max_tokens are visited once in Gray code order, each step adding or removing one token, so
+    that the subsets of 1..tokens are the first 2**tokens ones. The numbers of ways to reach each sum are updated
+    in place, removing a token undoing its addition.
+    """
+    max_sum = max(target_sums)
+    ways = [1] + [0] * max_sum
+    counts = [[0] * len(target_sums) for _ in range(max_tokens + 1)]
+    subset, size = 0, 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('taken_tokens', 'tokens', 'target_sum', 'successes', 'total', 'probability'))
+        for step in range(1, (1 << max_tokens) + 1):
+            # The empty subset does not count as a sum
+            counts[size] = [count + (ways[target_sum] > (target_sum == 0))
+                            for count, target_sum in zip(counts[size], target_sums)]
+
+            if step & (step - 1) == 0:
+                # All the subsets of 1..tokens have been visited
+                tokens = step.bit_length() - 1
+                for taken_tokens in range(tokens + 1):
+                    total = comb(tokens, taken_tokens)
+                    for successes, target_sum in zip(counts[taken_tokens], target_sums):
+                        writer.writerow((taken_tokens, tokens, target_sum, successes, total,
+                                         Fraction(successes, total)))
+                if tokens == max_tokens:
+                    break
+
+            token = (step & -step).bit_length()
+            subset ^= 1 << token - 1
+            if subset >> token - 1 & 1:
+                size += 1
+                for s in range(max_sum, token - 1, -1):
+                    ways[s] += ways[s - token]
+            else:
+                size -= 1
+                for s in range(token, max_sum + 1):
+                    ways[s] -= ways[s - token]
+
+
 if __name__ == "__main__":
+    *_, successes = gen_success_counts(17, 18, 10)
     for n in range(1, 11):
-        result = main(n)
+        result = Fraction(successes[n], comb(17, n))
         print(f"{n:2} {str(result):11} {float(result):.3f}")
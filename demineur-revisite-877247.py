@@ -1,35 +1,321 @@
 # https://www.ilemaths.net/sujet-demineur-revisite-877247.html
 
-from itertools import product
+from functools import partial
+from math import gcd, isqrt, lcm
+from multiprocessing import Pool
+from random import randrange
+from time import perf_counter
 
 
-def solve(m):
+def get_period(m, start):
+    """Period and valid lengths of the grid starting with the column start (bit i for cell i)
+
+    Columns are ints, the next one being x ^ x << 1 ^ x >> 1 ^ previous, complemented. The step is invertible, so the
+    states (previous, column) are purely periodic and Brent's algorithm finds the period without storing the grid.
+    Valid lengths are the positions where the next column is zero, recorded while the hare walks.
+    """
+    full = (1 << m) - 1
+    tortoise = hare = (0, start)
+    power = period = 1
+    position, zeros = 0, []
+    while True:
+        previous, column = hare
+        hare = column, (column ^ column << 1 ^ column >> 1 ^ previous ^ full) & full
+        position += 1
+        if hare[1] == 0:
+            zeros.append(position)
+        if hare == tortoise:
+            break
+        if power == period:
+            tortoise = hare
+            power *= 2
+            period = 0
+        period += 1
+    return start, period, [length for length in zeros if length <= period]
+
+
+def get_grid(m, start, length):
+    full = (1 << m) - 1
+    grid, previous, column = [], 0, start
+    for _ in range(length):
+        grid.append(tuple(bool(column >> i & 1) for i in range(m)))
+        previous, column = column, (column ^ column << 1 ^ column >> 1 ^ previous ^ full) & full
+    return grid
+
+
+def solve(m, show=False, processes=None):
     solutions = {}
-    for start in product((True, False), repeat=m):
-        grid = [start]
+    with Pool(processes) as pool:
+        for start, period, valid_lengths in pool.imap_unordered(partial(get_period, m), range(1 << m),
+                                                                 chunksize=1 + (1 << m) // 256):
+            if show:
+                show_grid(get_grid(m, start, period))
+                print(period, valid_lengths)
+            solutions.setdefault(period, set())
+            solutions[period] |= set(valid_lengths)
+
+    return solutions
+
+
+def get_step(m):
+    """Images of the basis vectors by the step (u, x, 1) -> (x, A x + u + 1) over GF(2)
+
+    A state is an int: bits 0..m-1 for the previous column u, m..2m-1 for the current column x and 2m for the
+    constant 1 that makes the step linear. (A x)[i] = x[i-1] + x[i] + x[i+1], so A x + u + 1 is the next column.
+    """
+    full = (1 << m) - 1
+    columns = []
+    for j in range(2*m + 1):
+        u, x, one = 1 << j & full, 1 << j >> m & full, j == 2*m
+        columns.append(x | ((x ^ x << 1 ^ x >> 1 ^ u ^ full * one) & full) << m | one << 2*m)
+    return columns
+
+
+def apply(columns, vector):
+    image = 0
+    while vector:
+        bit = vector & -vector
+        image ^= columns[bit.bit_length() - 1]
+        vector ^= bit
+    return image
+
+
+def matrix_power(columns, exponent):
+    result = [1 << j for j in range(len(columns))]
+    while exponent:
+        if exponent & 1:
+            result = [apply(columns, column) for column in result]
+        columns = [apply(columns, column) for column in columns]
+        exponent >>= 1
+    return result
+
+
+def poly_divmod(a, b):
+    """Polynomials over GF(2) are ints, bit i being the coefficient of x^i"""
+    quotient = 0
+    while a.bit_length() >= b.bit_length():
+        shift = a.bit_length() - b.bit_length()
+        quotient ^= 1 << shift
+        a ^= b << shift
+    return quotient, a
+
+
+def poly_product(a, b):
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+    return result
+
+
+def poly_mulmod(a, b, modulus):
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a.bit_length() == modulus.bit_length():
+            a ^= modulus
+    return result
+
+
+def poly_powmod(a, exponent, modulus):
+    result = 1
+    while exponent:
+        if exponent & 1:
+            result = poly_mulmod(result, a, modulus)
+        a = poly_mulmod(a, a, modulus)
+        exponent >>= 1
+    return result
+
 
-        valid_lengths, current_length = [], 1
+def poly_gcd(a, b):
+    while b:
+        a, b = b, poly_divmod(a, b)[1]
+    return a
+
+
+def get_minimal_polynomial(columns):
+    """Least common multiple of the minimal polynomials of the basis vectors, from their Krylov sequences"""
+    minimal_polynomial = 1
+    for vector in (1 << j for j in range(len(columns))):
+        # Pivot bit -> (reduced vector, polynomial giving it from the sequence)
+        basis = {}
+        power = 0
         while True:
-            count = [(grid[-1][i]
-                      + (grid[-2][i] if current_length > 1 else 0)
-                      + (grid[-1][i - 1] if i > 0 else 0)
-                      + (grid[-1][i + 1] if i < m - 1 else 0))
-                     for i in range(m)]
+            reduced, polynomial = vector, 1 << power
+            while reduced and (pivot := reduced.bit_length() - 1) in basis:
+                reduced ^= basis[pivot][0]
+                polynomial ^= basis[pivot][1]
+            if not reduced:
+                break
+            basis[pivot] = reduced, polynomial
+            vector = apply(columns, vector)
+            power += 1
+        minimal_polynomial = poly_divmod(poly_product(minimal_polynomial, polynomial),
+                                         poly_gcd(minimal_polynomial, polynomial))[0]
+    return minimal_polynomial
 
-            if all(c % 2 == 1 for c in count):
-                valid_lengths.append(current_length)
 
-            next_column = tuple(c % 2 == 0 for c in count)
-            if next_column == start and all(c == 0 for c in grid[-1]):
+def get_factor_degrees(polynomial):
+    """Degrees of the irreducible factors of polynomial (distinct degree factorisation)"""
+    degrees = set()
+    remaining, x_power, degree = polynomial, 0b10, 0
+    while remaining.bit_length() > 1:
+        degree += 1
+        if remaining.bit_length() - 1 < 2*degree:
+            degrees.add(remaining.bit_length() - 1)
+            break
+        x_power = poly_powmod(x_power, 2, remaining)
+        common = poly_gcd(remaining, x_power ^ 0b10)
+        if common != 1:
+            degrees.add(degree)
+            while (common := poly_gcd(remaining, common)) != 1:
+                remaining = poly_divmod(remaining, common)[0]
+            x_power = poly_divmod(x_power, remaining)[1]
+    return degrees
+
+
+def is_prime(n):
+    if n < 2:
+        return False
+    small_primes = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+    for p in small_primes:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for a in small_primes:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
                 break
+        else:
+            return False
+    return True
+
+
+def factorize(n, factors=None):
+    """Prime factors of n with multiplicity (Pollard's rho)"""
+    factors = {} if factors is None else factors
+    for p in (2, 3, 5, 7):
+        while n % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            n //= p
+    if n == 1:
+        return factors
+    if is_prime(n):
+        factors[n] = factors.get(n, 0) + 1
+        return factors
+    if isqrt(n) ** 2 == n:
+        factorize(isqrt(n), factors)
+        return factorize(isqrt(n), factors)
+    while True:
+        x = y = randrange(2, n)
+        c, d = randrange(1, n), 1
+        while d == 1:
+            x = (x * x + c) % n
+            y = (y * y + c) % n
+            y = (y * y + c) % n
+            d = gcd(abs(x - y), n)
+        if d != n:
+            factorize(d, factors)
+            return factorize(n // d, factors)
+
+
+def get_order(columns):
+    """Smallest N > 0 with M^N = I, from the minimal polynomial f: x^N = 1 mod f
+
+    N divides 2^t lcm(2^d - 1) over the degrees d of the irreducible factors of f, 2^t being at least their
+    multiplicity, and the prime factors are removed while x^(N/p) is still 1.
+    """
+    polynomial = get_minimal_polynomial(columns)
+    order = 1 << (polynomial.bit_length() - 1).bit_length()
+    for degree in get_factor_degrees(polynomial):
+        order = lcm(order, (1 << degree) - 1)
+    for p in factorize(order):
+        while order % p == 0 and poly_powmod(0b10, order // p, polynomial) == 1:
+            order //= p
+    return order
+
 
-            grid.append(next_column)
-            current_length += 1
+def get_divisors(factors):
+    divisors = [1]
+    for p, exponent in factors.items():
+        divisors = [d * p ** e for d in divisors for e in range(exponent + 1)]
+    return sorted(divisors)
 
-        show_grid(grid)
-        print(current_length, valid_lengths)
-        solutions.setdefault(current_length, set())
-        solutions[current_length] |= set(valid_lengths)
+
+def count_solutions(equations, m):
+    """Number of s in GF(2)^m with c.s = b for each equation c | b << m, by Gaussian elimination on ints"""
+    pivots = {}
+    for equation in equations:
+        while (coefficients := equation & ((1 << m) - 1)) and (pivot := coefficients.bit_length() - 1) in pivots:
+            equation ^= pivots[pivot]
+        if coefficients:
+            pivots[pivot] = equation
+        elif equation:
+            return 0
+    return 1 << m - len(pivots)
+
+
+def get_period_equations(columns, period, m):
+    """Equations on the starting column s for (0, s, 1) to be back after period steps"""
+    power = matrix_power(columns, period)
+    equations = []
+    for bit in range(2*m + 1):
+        coefficients = sum((power[m + i] >> bit & 1) << i for i in range(m))
+        constant = power[2*m] >> bit & 1
+        if m <= bit < 2*m:
+            coefficients ^= 1 << bit - m
+        constant ^= bit == 2*m
+        if coefficients or constant:
+            equations.append(coefficients | constant << m)
+    return equations
+
+
+def solve_gf2(m):
+    """Same solutions as solve, without stepping through the grid of each starting column
+
+    The starting columns of period dividing D are the solutions of (M^D - I)(0, s, 1) = 0 for the step matrix M, and
+    D divides the order of M. Numbers of starting columns of exact period P (with a column of zeros after L columns,
+    itself an affine condition on s) come from Moebius inclusion exclusion over the divisors of P.
+    """
+    columns = get_step(m)
+    order_factors = factorize(get_order(columns))
+    equations = {d: get_period_equations(columns, d, m) for d in get_divisors(order_factors)}
+
+    def count_exact_period(period, extra_equations):
+        primes = [p for p in order_factors if period % p == 0]
+        count = 0
+        for subset in range(1 << len(primes)):
+            divisor, sign = period, 1
+            for i, p in enumerate(primes):
+                if subset >> i & 1:
+                    divisor, sign = divisor // p, -sign
+            count += sign * count_solutions(equations[divisor] + extra_equations, m)
+        return count
+
+    solutions = {period: set() for period in equations if count_exact_period(period, [])}
+
+    # Column j as affine forms in s (bit m is the constant), column -1 being zero
+    previous, column = [0] * m, [1 << i for i in range(m)]
+    for length in range(1, max(solutions) + 1):
+        previous, column = column, [column[i] ^ (column[i - 1] if i > 0 else 0) ^ (column[i + 1] if i < m - 1 else 0)
+                                    ^ previous[i] ^ 1 << m for i in range(m)]
+        # Valid when the next column is zero
+        if not count_solutions(column, m):
+            continue
+        for period in solutions:
+            if length <= period and count_exact_period(period, column):
+                solutions[period].add(length)
 
     return solutions
 
@@ -40,9 +326,17 @@ def show_grid(grid):
 
 
 def main():
-    solutions = solve(3)
+    solutions = solve(3, show=True)
     print(solutions)
 
 
+def main_gf2(max_m=32):
+    for m in range(1, max_m + 1):
+        start = perf_counter()
+        solutions = solve_gf2(m)
+        print(f"{m:2} {perf_counter()-start:7.3f}s " + ", ".join(
+            f"{period}: {len(lengths)} lengths" for period, lengths in sorted(solutions.items())))
+
+
 if __name__ == "__main__":
     main()